@@ -1,28 +1,104 @@
 import streamlit as st
 import sqlite3
 import pandas as pd
+import numpy as np
 import hashlib
+import hmac
+import secrets
 import datetime as dt
 import plotly.express as px
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 DB_FILE = "finance_db.db"
+ENTRY_CSV_COLUMNS = ("type", "category", "amount", "date")
+# Accepted CSV date spellings, tried in order; slashed/dashed day-first dates are read dd/mm
+CSV_DATE_FORMATS = ("%Y-%m-%d", "%Y%m%d", "%d/%m/%Y", "%d-%m-%Y")
+DUMMY_SALT = "00" * 16
+_HAS_UPPER = re.compile(r"[A-Z]").search
+
+# Hot-path statements in one place; plan reuse comes from sqlite3's statement cache, keyed by SQL text
+SQL_SELECT_USER = "SELECT id, username, password, salt FROM users WHERE username=?"
+SQL_INSERT_USER = "INSERT INTO users (username, password, salt) VALUES (?, ?, ?)"
+SQL_UPDATE_PASSWORD = "UPDATE users SET password=?, salt=? WHERE id=?"
+SQL_INSERT_ENTRY = "INSERT INTO entries (user_id, type, category, amount, date) VALUES (?, ?, ?, ?, ?)"
+SQL_UPSERT_BUDGET = """INSERT INTO budgets (user_id, category, amount, month, year) VALUES (?, ?, ?, ?, ?)
+                       ON CONFLICT(user_id, category, month, year) DO UPDATE SET amount=excluded.amount"""
+SQL_SELECT_ENTRIES = "SELECT * FROM entries WHERE user_id=?"
+SQL_SELECT_BUDGETS = "SELECT category, amount FROM budgets WHERE user_id=? AND year=? AND month=?"
+SQL_MONTHLY_SPEND = """SELECT category, SUM(amount) FROM entries
+                       WHERE user_id=? AND type='expense' AND date BETWEEN ? AND ?
+                       GROUP BY category"""
+
+# Budget usage fractions that start each alert tier; tier 0 (under 25%) stays silent
+ALERT_THRESHOLDS = [0.25, 0.5, 0.75, 1.0]
+ALERT_TEMPLATES = [
+    None,
+    "⚠ Early alert: {category} at {pctp:.0f}% (₹{used:.2f}/₹{amount:.2f})",
+    "🔥 Warning: {category} at {pctp:.0f}% (₹{used:.2f}/₹{amount:.2f})",
+    "🚨 Budget almost used for {category} (₹{used:.2f}/₹{amount:.2f})",
+    "❌ Budget EXCEEDED for {category}! Spent ₹{used:.2f} of ₹{amount:.2f}",
+]
+# Bound format_map per tier, so rendering is a table lookup rather than a branch
+ALERT_FORMATTERS = [None] + [template.format_map for template in ALERT_TEMPLATES[1:]]
 
 # ---------------- Database Setup ----------------
+@st.cache_resource
+def get_write_lock():
+    """Serializes writes on the shared connection; Streamlit runs sessions on worker threads.
+
+    Cached like the connection because module globals are rebuilt on every rerun.
+    """
+    return threading.Lock()
+
+@st.cache_resource
+def get_conn():
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level=None,
+                           cached_statements=256)
+    conn.executescript("""PRAGMA journal_mode=WAL;
+                          PRAGMA synchronous=NORMAL;
+                          PRAGMA temp_store=MEMORY;
+                          PRAGMA cache_size=-64000;""")
+    return conn
+
+@contextmanager
+def write_txn():
+    """Run the enclosed writes as one locked transaction on the shared connection."""
+    conn = get_conn()
+    with get_write_lock():
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+def query_rows(sql, params=()):
+    """Run a read query and return sqlite3.Row results addressable by column name."""
+    c = get_conn().cursor()
+    c.row_factory = sqlite3.Row
+    return c.execute(sql, params).fetchall()
+
+@st.cache_resource
 def init_db():
-    with sqlite3.connect(DB_FILE) as conn:
+    """Create/migrate the schema once per server process rather than on every rerun."""
+    with write_txn() as conn:
         c = conn.cursor()
         c.execute("""CREATE TABLE IF NOT EXISTS users (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         username TEXT UNIQUE,
                         password TEXT)""")
-        c.execute("""CREATE TABLE IF NOT EXISTS entries (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER,
-                        type TEXT,
-                        category TEXT,
-                        amount REAL,
-                        date TEXT)""")
+        entries_ddl = """CREATE TABLE IF NOT EXISTS entries (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            user_id INTEGER,
+                            type TEXT,
+                            category TEXT,
+                            amount REAL,
+                            date INTEGER)"""
+        c.execute(entries_ddl)
         c.execute("""CREATE TABLE IF NOT EXISTS budgets (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         user_id INTEGER,
@@ -30,9 +106,42 @@ def init_db():
                         amount REAL,
                         month INTEGER,
                         year INTEGER)""")
-        conn.commit()
+        user_cols = {col[1] for col in c.execute("PRAGMA table_info(users)")}
+        if "salt" not in user_cols:
+            c.execute("ALTER TABLE users ADD COLUMN salt TEXT")
+        entry_types = {col[1]: col[2] for col in c.execute("PRAGMA table_info(entries)")}
+        if entry_types["date"] == "TEXT":
+            # Dates used to be ISO text; SQLite can't retype a column, so rebuild with yyyymmdd ints
+            c.execute("ALTER TABLE entries RENAME TO entries_old")
+            c.execute(entries_ddl)
+            c.execute("""INSERT INTO entries (id, user_id, type, category, amount, date)
+                         SELECT id, user_id, type, category, amount,
+                                CAST(REPLACE(SUBSTR(date, 1, 10), '-', '') AS INTEGER)
+                         FROM entries_old""")
+            c.execute("DROP TABLE entries_old")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_entries_user_date ON entries(user_id, date)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_entries_user_type ON entries(user_id, type, category)")
+        if not c.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_budgets_key'").fetchone():
+            # Older databases may hold duplicate budgets; keep the latest one per key
+            c.execute("""DELETE FROM budgets WHERE id NOT IN (
+                            SELECT MAX(id) FROM budgets GROUP BY user_id, category, month, year)""")
+            c.execute("CREATE UNIQUE INDEX idx_budgets_key ON budgets(user_id, category, month, year)")
+    return True
+
+@st.cache_resource
+def get_kdf_pool():
+    """Worker pool for scrypt; bounds concurrent 16 MB KDF runs across all sessions."""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="kdf")
+
+def _scrypt_hex(password, salt):
+    return hashlib.scrypt(password.encode(), salt=bytes.fromhex(salt),
+                          n=2**14, r=8, p=1, dklen=32).hex()
 
-def hash_password(password):
+def hash_password(password, salt):
+    return get_kdf_pool().submit(_scrypt_hex, password, salt).result()
+
+def legacy_hash_password(password):
+    """Unsalted SHA-256 used before scrypt; only checked for users with no salt yet."""
     return hashlib.sha256(password.encode()).hexdigest()
 
 # ---------------- User Management ----------------
@@ -40,7 +149,7 @@ def validate_password(password: str) -> str:
     """Validate password strength. Return error message if invalid, else empty string."""
     if len(password) < 8:
         return "Password must be at least 8 characters long."
-    if not re.search(r"[A-Z]", password):
+    if not _HAS_UPPER(password):
         return "Password must contain at least one uppercase letter."
     return ""
 
@@ -49,87 +158,140 @@ def register_user(username, password):
     if pwd_error:
         return False, pwd_error
 
-    with sqlite3.connect(DB_FILE) as conn:
-        c = conn.cursor()
-        try:
-            c.execute("INSERT INTO users (username, password) VALUES (?, ?)", 
-                      (username, hash_password(password)))
-            conn.commit()
-            return True, "Account created successfully."
-        except sqlite3.IntegrityError:
-            return False, "Username already exists."
+    salt = secrets.token_hex(16)
+    digest = hash_password(password, salt)
+    try:
+        with write_txn() as conn:
+            conn.execute(SQL_INSERT_USER, (username, digest, salt))
+        return True, "Account created successfully."
+    except sqlite3.IntegrityError:
+        return False, "Username already exists."
 
 def login_user(username, password):
-    with sqlite3.connect(DB_FILE) as conn:
-        c = conn.cursor()
-        c.execute("SELECT * FROM users WHERE username=? AND password=?", 
-                  (username, hash_password(password)))
-        return c.fetchone()
+    """Return {'id', 'username'} for valid credentials, else None."""
+    rows = query_rows(SQL_SELECT_USER, (username,))
+    if not rows:
+        # Pay the same KDF cost as a real user so response time doesn't reveal which names exist
+        hash_password(password, DUMMY_SALT)
+        return None
+    row = rows[0]
+    user = {'id': row['id'], 'username': row['username']}
+    if row['salt']:
+        return user if hmac.compare_digest(hash_password(password, row['salt']), row['password']) else None
+    if not hmac.compare_digest(legacy_hash_password(password), row['password']):
+        hash_password(password, DUMMY_SALT)
+        return None
+    # Upgrade the legacy digest now that we have the plaintext
+    salt = secrets.token_hex(16)
+    digest = hash_password(password, salt)
+    with write_txn() as conn:
+        conn.execute(SQL_UPDATE_PASSWORD, (digest, salt, row['id']))
+    return user
 
 # ---------------- Data Management ----------------
-def add_entry(user_id, etype, category, amount, date):
-    with sqlite3.connect(DB_FILE) as conn:
-        c = conn.cursor()
-        c.execute("INSERT INTO entries (user_id, type, category, amount, date) VALUES (?, ?, ?, ?, ?)", 
-                  (user_id, etype, category, amount, date))
-        conn.commit()
+def date_key(date):
+    """Encode a date as the yyyymmdd integer stored in entries.date."""
+    return date.year * 10000 + date.month * 100 + date.day
+
+def with_display_dates(df):
+    """Return a copy of an entries frame with yyyymmdd ints turned into datetimes for display."""
+    key = df["date"].astype("int64")
+    df = df.copy()
+    df["date"] = pd.to_datetime(pd.DataFrame({"year": key // 10000, "month": key // 100 % 100, "day": key % 100}))
+    return df
+
+def add_entries(user_id, rows):
+    """Insert (type, category, amount, yyyymmdd date) rows in a single transaction."""
+    with write_txn() as conn:
+        conn.executemany(SQL_INSERT_ENTRY, [(user_id, *row) for row in rows])
+    get_entries_df.clear()
+
+def parse_entries_csv(file):
+    """Parse an uploaded CSV into entry rows. Return (rows, skipped row count, error message)."""
+    try:
+        # Keep blank lines so the index still maps to file line numbers in error messages
+        df = pd.read_csv(file, dtype={"date": str}, skip_blank_lines=False)
+    except (pd.errors.EmptyDataError, pd.errors.ParserError, UnicodeDecodeError):
+        return [], 0, "Could not read the CSV file."
+    df.columns = df.columns.astype(str).str.strip().str.lower()
+    missing = [col for col in ENTRY_CSV_COLUMNS if col not in df.columns]
+    if missing:
+        return [], 0, f"CSV is missing column(s): {', '.join(missing)}"
+    df = df.dropna(how="all")
+
+    amounts = pd.to_numeric(df["amount"], errors="coerce")
+    date_text = df["date"].str.strip()
+    dates = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+    for fmt in CSV_DATE_FORMATS:
+        dates = dates.fillna(pd.to_datetime(date_text, format=fmt, errors="coerce"))
+    bad_amount = df["amount"].notna() & ~(np.isfinite(amounts) & (amounts >= 0))
+    invalid = bad_amount | (df["date"].notna() & dates.isna())
+    if invalid.any():
+        # +2: one for the header line, one for 1-based numbering
+        lines = ", ".join(str(i + 2) for i in df.index[invalid])
+        return [], 0, f"Invalid amount or date on CSV line(s): {lines}"
+
+    types = df["type"].astype(str).str.strip().str.lower()
+    valid = types.isin(["income", "expense"]) & df["category"].notna() & amounts.notna() & dates.notna()
+    rows = list(zip(types[valid].tolist(),
+                    df.loc[valid, "category"].astype(str).tolist(),
+                    amounts[valid].astype(float).tolist(),
+                    dates[valid].dt.strftime("%Y%m%d").astype(int).tolist()))
+    return rows, int((~valid).sum()), ""
 
 def set_budget(user_id, category, amount, month, year):
-    with sqlite3.connect(DB_FILE) as conn:
-        c = conn.cursor()
-        c.execute("SELECT id FROM budgets WHERE user_id=? AND category=? AND month=? AND year=?", 
-                  (user_id, category, month, year))
-        if c.fetchone():
-            c.execute("UPDATE budgets SET amount=? WHERE user_id=? AND category=? AND month=? AND year=?", 
-                      (amount, user_id, category, month, year))
-        else:
-            c.execute("INSERT INTO budgets (user_id, category, amount, month, year) VALUES (?, ?, ?, ?, ?)", 
-                      (user_id, category, amount, month, year))
-        conn.commit()
+    with write_txn() as conn:
+        conn.execute(SQL_UPSERT_BUDGET, (user_id, category, amount, month, year))
 
+@st.cache_data(ttl=300)
 def get_entries_df(user_id):
-    with sqlite3.connect(DB_FILE) as conn:
-        df = pd.read_sql_query("SELECT * FROM entries WHERE user_id=?", conn, params=(user_id,))
-        if not df.empty:
-            df["date"] = pd.to_datetime(df["date"])
-        return df
+    df = pd.read_sql_query(SQL_SELECT_ENTRIES, get_conn(), params=(user_id,))
+    df["type"] = df["type"].astype("category")
+    # Converted once here so cached reruns don't redo it; SQL filters still use the int column
+    return with_display_dates(df)
 
 def get_budgets(user_id, year, month):
-    with sqlite3.connect(DB_FILE) as conn:
-        return pd.read_sql_query("SELECT * FROM budgets WHERE user_id=? AND year=? AND month=?", 
-                                 conn, params=(user_id, year, month))
+    """Return the month's budgets as (category, amount) rows; too few to warrant a DataFrame."""
+    return query_rows(SQL_SELECT_BUDGETS, (user_id, year, month))
+
+def monthly_spend(user_id, year, month):
+    """Return {category: total expense} for one month, aggregated in SQL."""
+    first = date_key(dt.date(year, month, 1))
+    c = get_conn().execute(SQL_MONTHLY_SPEND, (user_id, first, first + 30))
+    return dict(c.fetchall())
 
 # ---------------- Budget Notifications ----------------
-def check_budget_notifications(user_id, year, month):
+def compute_alert_tiers(amounts, used):
+    """Return (tier, usage ratio) arrays; budgets of zero or less are never alerted."""
+    pct = np.divide(used, amounts, out=np.zeros_like(used), where=amounts > 0)
+    return np.digitize(pct, ALERT_THRESHOLDS), pct
+
+def check_budget_notifications(user_id, year, month, spent=None):
+    """Build alert messages; pass `spent` from monthly_spend() to skip re-aggregating."""
     budgets = get_budgets(user_id, year, month)
-    if budgets.empty:
+    if not budgets:
         return []
 
-    df = get_entries_df(user_id)
-    spent = df[(df['type']=='expense') & 
-               (df['date'].dt.year==year) & 
-               (df['date'].dt.month==month)].groupby('category')['amount'].sum()
-
-    notifications = []
-    for _, row in budgets.iterrows():
-        used = spent.get(row['category'], 0)
-        if row['amount'] > 0:
-            pct = used / row['amount']
-            if pct >= 1.0:
-                notifications.append(f"❌ Budget EXCEEDED for {row['category']}! "
-                                     f"Spent ₹{used:.2f} of ₹{row['amount']:.2f}")
-            elif pct >= 0.75:
-                notifications.append(f"🚨 Budget almost used for {row['category']} "
-                                     f"(₹{used:.2f}/₹{row['amount']:.2f})")
-            elif pct >= 0.5:
-                notifications.append(f"🔥 Warning: {row['category']} at {pct*100:.0f}% "
-                                     f"(₹{used:.2f}/₹{row['amount']:.2f})")
-            elif pct >= 0.25:
-                notifications.append(f"⚠ Early alert: {row['category']} at {pct*100:.0f}% "
-                                     f"(₹{used:.2f}/₹{row['amount']:.2f})")
+    if spent is None:
+        spent = monthly_spend(user_id, year, month)
+
+    categories = [row['category'] for row in budgets]
+    amounts = np.array([row['amount'] for row in budgets], dtype=float)
+    used = np.array([spent.get(cat, 0.0) for cat in categories], dtype=float)
+    tiers, pct = compute_alert_tiers(amounts, used)
+
+    notifications = [ALERT_FORMATTERS[tier]({'category': cat, 'amount': amt, 'used': u, 'pctp': p * 100})
+                     for tier, cat, amt, u, p in zip(tiers, categories, amounts, used, pct) if tier > 0]
     return notifications
 
 # ---------------- Streamlit UI ----------------
+def save_pending_entries(user_id):
+    """Button callback: flush the queued entries in one transaction."""
+    pending = st.session_state['pending_entries']
+    add_entries(user_id, pending)
+    st.session_state['_saved_count'] = len(pending)
+    pending.clear()
+
 st.set_page_config(page_title="Personal Finance Tracker", layout="wide")
 init_db()
 
@@ -141,7 +303,8 @@ if choice == "Register":
     username = st.text_input("Username")
     password = st.text_input("Password", type="password")
     if st.button("Register"):
-        success, msg = register_user(username, password)
+        with st.spinner("Creating account..."):
+            success, msg = register_user(username, password)
         if success:
             st.success(msg)
         else:
@@ -153,9 +316,13 @@ elif choice == "Login":
     password = st.text_input("Password", type="password")
 
     if st.button("Login"):
-        user = login_user(username, password)
+        with st.spinner("Authenticating..."):
+            user = login_user(username, password)
         if user:
             st.session_state['user'] = user
+            # Queued entries belong to whoever queued them; never save them under a new login
+            st.session_state['pending_entries'] = []
+            st.session_state.pop('_shown_alerts', None)
             st.success(f"Welcome {username}")
         else:
             st.error("Invalid username or password.")
@@ -163,7 +330,7 @@ elif choice == "Login":
 # ---------------- Dashboard ----------------
 if "user" in st.session_state:
     user = st.session_state['user']
-    uid = user[0]
+    uid = user['id']
     today = dt.date.today()
 
     st.title("📊 Personal Finance Dashboard")
@@ -178,14 +345,32 @@ if "user" in st.session_state:
     amount = st.number_input("Amount", min_value=0.0, step=100.0)
     date = st.date_input("Date", today)
 
+    pending = st.session_state.setdefault('pending_entries', [])
     if st.button("Add Entry"):
-        add_entry(uid, etype, category, amount, str(date))
-        st.success("Entry added successfully!")
-        # 🔔 Instant budget check
-        alerts = check_budget_notifications(uid, today.year, today.month)
-        if alerts:
-            for alert in alerts:
-                st.toast(alert)
+        pending.append((etype, category, amount, date_key(date)))
+        st.success("Entry queued. Click 'Save Entries' to store it.")
+
+    # Set by the Save Entries callback, which runs before this rerun draws the queue
+    saved = st.session_state.pop('_saved_count', 0)
+    if saved:
+        st.success(f"{saved} entries saved successfully!")
+    if pending:
+        st.dataframe(with_display_dates(pd.DataFrame(pending, columns=ENTRY_CSV_COLUMNS)),
+                     column_config={"date": st.column_config.DateColumn("date")})
+        st.button("Save Entries", on_click=save_pending_entries, args=(uid,))
+
+    # Import Entries
+    upload = st.file_uploader("📥 Import entries from CSV (type, category, amount, date)", type="csv")
+    if upload is not None and st.button("Import CSV"):
+        rows, skipped, csv_error = parse_entries_csv(upload)
+        if csv_error:
+            st.error(csv_error)
+        else:
+            add_entries(uid, rows)
+            saved = len(rows)
+            st.success(f"{saved} entries imported successfully!")
+            if skipped:
+                st.warning(f"{skipped} row(s) skipped: missing values or a type other than income/expense.")
 
     # Set Budget
     st.subheader("💰 Set Monthly Budget")
@@ -198,36 +383,44 @@ if "user" in st.session_state:
     # Data
     df = get_entries_df(uid)
     st.subheader("📒 All Entries")
-    st.dataframe(df)
+    st.dataframe(df, column_config={"date": st.column_config.DateColumn("date")})
 
     # Analytics
     if not df.empty:
         st.subheader("📈 Expense Analytics")
-        exp_df = df[df['type'] == 'expense']
-        if not exp_df.empty:
+        # One pass gives both the income and expense splits
+        by_type_cat = df.groupby(['type', 'category'], observed=True)['amount'].sum()
+        if 'expense' in by_type_cat.index.unique(level='type'):
+            cat_totals = by_type_cat.loc['expense'].reset_index()
             col1, col2 = st.columns(2)
             with col1:
-                pie = px.pie(exp_df, values='amount', names='category', title="Expenses by Category")
+                pie = px.pie(cat_totals, values='amount', names='category', title="Expenses by Category")
                 st.plotly_chart(pie, use_container_width=True)
             with col2:
-                bar = px.bar(exp_df.groupby('category')['amount'].sum().reset_index(),
-                             x='category', y='amount', title="Expenses by Category (Bar Chart)")
+                bar = px.bar(cat_totals, x='category', y='amount', title="Expenses by Category (Bar Chart)")
                 st.plotly_chart(bar, use_container_width=True)
 
     # Budget Overview
     st.subheader("📊 Budget Overview")
     budgets = get_budgets(uid, today.year, today.month)
-    if not budgets.empty:
-        exp_df = df[df['type'] == 'expense']
-        spent = exp_df.groupby('category')['amount'].sum() if not exp_df.empty else {}
-        for _, row in budgets.iterrows():
+    spent = None
+    if budgets:
+        spent = monthly_spend(uid, today.year, today.month)
+        for row in budgets:
             used = spent.get(row['category'], 0)
             progress = min(used / row['amount'], 1.0) if row['amount'] > 0 else 0
             st.progress(progress)
             st.write(f"{row['category']}: ₹{used:.2f}/₹{row['amount']:.2f}")
 
     # Show Budget Notifications
-    notifications = check_budget_notifications(uid, today.year, today.month)
+    notifications = check_budget_notifications(uid, today.year, today.month, spent)
+    if saved:
+        # 🔔 Instant budget check: toast only the alerts these entries changed
+        seen = st.session_state.get('_shown_alerts', [])
+        for alert in notifications:
+            if alert not in seen:
+                st.toast(alert)
+    st.session_state['_shown_alerts'] = notifications
     if notifications:
         st.subheader("🔔 Budget Notifications")
         for note in notifications: